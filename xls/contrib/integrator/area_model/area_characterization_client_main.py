@@ -20,11 +20,17 @@ These datapoints can be used in an area model (where they may be interpolated)
 format.
 """
 
+from concurrent import futures
+import dataclasses
 import functools
-import math
+import hashlib
+import itertools
 import operator
+import shelve
+import sys
+import threading
 
-from typing import List, Sequence, Optional, Tuple
+from typing import Iterable, Iterator, List, Sequence, Optional, Tuple
 
 from absl import app
 from absl import flags
@@ -32,20 +38,39 @@ from absl import logging
 
 import grpc
 
+from google.protobuf import text_format
+
 from xls.delay_model import delay_model
 from xls.delay_model import delay_model_pb2
 from xls.delay_model import op_module_generator
-from xls.ir.python import bits
 from xls.synthesis import client_credentials
 from xls.synthesis import synthesis_pb2
 from xls.synthesis import synthesis_service_pb2_grpc
 
 FLAGS = flags.FLAGS
 flags.DEFINE_integer('port', 10000, 'Port to connect to synthesis server on.')
-
-FREE_OPS = (
-    'kArray kArrayConcat kBitSlice kConcat kIdentity '
-    'kLiteral kParam kReverse kTuple kTupleIndex kZeroExt kSignExt').split()
+flags.DEFINE_integer(
+    'max_in_flight_requests', 32,
+    'Maximum number of outstanding requests to the synthesis server.')
+flags.DEFINE_integer(
+    'batch_size', 1,
+    'Number of modules to synthesize per request to the synthesis server. Each '
+    'module already packs up to --ops_per_module operations, and the servers '
+    'synthesize the modules of a request one after another, so larger batches '
+    'only reduce concurrency.')
+flags.DEFINE_integer(
+    'ops_per_module', 32,
+    'Maximum number of characterized operations to instantiate in each module '
+    'sent to the synthesis server.')
+flags.DEFINE_string(
+    'synthesis_cache', None,
+    'Path of a database in which to persist synthesis results across runs. If '
+    'not given, results are only reused within a run. Results are not keyed '
+    'by synthesis server, so use a separate database for each server setup.')
+
+FREE_OPS: Tuple[str, ...] = ('kArray', 'kArrayConcat', 'kBitSlice', 'kConcat',
+                             'kIdentity', 'kLiteral', 'kParam', 'kReverse',
+                             'kTuple', 'kTupleIndex', 'kZeroExt', 'kSignExt')
 
 logging.set_verbosity(logging.INFO)
 
@@ -53,10 +78,38 @@ logging.set_verbosity(logging.INFO)
 NUM_CROSS_VALIDATION_FOLDS = 5
 MAX_FOLD_GEOMEAN_ERROR = 0.15
 
+# Synthesis server responses (stripped by _strip_response) keyed by
+# _synthesis_cache_key.
+_synthesis_cache = {}
+
+# Serialized synthesis server responses (stripped by _strip_response) keyed by
+# _synthesis_cache_key which persist across runs. Opened by main if
+# --synthesis_cache is given. Shelves are not thread safe, so accesses are
+# guarded by _persistent_synthesis_cache_lock.
+_persistent_synthesis_cache: Optional[shelve.Shelf] = None
+_persistent_synthesis_cache_lock = threading.Lock()
+
+# Bounds the requests outstanding to the synthesis server across all
+# (concurrently running) sweeps. Set by run_characterization.
+_in_flight_requests: Optional[threading.BoundedSemaphore] = None
+
+# Options for the channel to the synthesis server. Allow for the large modules
+# produced by packing many operations into each synthesized module. Keepalive
+# pings are left disabled: synthesis RPCs run for minutes without sending data
+# and the servers' default ping policy would close the connection.
+_CHANNEL_OPTIONS = (
+    ('grpc.max_send_message_length', 64 << 20),
+    ('grpc.max_receive_message_length', 64 << 20),
+)
+
 # Standard bitwidth strides.
 # Use bigger strides for more-nested / slower-running loops.
 BITWIDTH_STRIDE_DEGREES = [2, 4, 12, 16]
 
+# Bits type strings indexed by bit count. Covers (with room to spare) the bit
+# counts produced by the sweeps below.
+_BITS_TYPES = tuple(f'bits[{bit_count}]' for bit_count in range(128))
+
 
 def _array_elements_sweep():
   """Yields a standard range of array elements along a single dimension."""
@@ -191,26 +244,140 @@ def _new_regression_op_model(
   return add_op_model
 
 
-def _synth(stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
-           verilog_text: str,
-           top_module_name: str) -> synthesis_pb2.CompileResponse:
-  request = synthesis_pb2.CompileRequest()
-  request.module_text = verilog_text
-  request.top_module_name = top_module_name
-  logging.vlog(3, '--- Request')
-  logging.vlog(3, request)
+def _synthesis_cache_key(request: synthesis_pb2.CompileRequest) -> str:
+  """Returns the key identifying the synthesis results of the given request.
 
-  return stub.Compile(request)
+  The key is a 128-bit digest of the whole request rather than the request
+  itself so the caches do not hold on to every (multi-kilobyte) module
+  synthesized. The key does not identify the synthesis server, so cached results
+  are only valid for the server setup (tool, target, flags) which produced them.
 
+  Args:
+    request: Request to synthesize the module.
+  """
+  return hashlib.blake2b(
+      request.SerializeToString(deterministic=True),
+      digest_size=16).hexdigest()
 
-def _record_area(response: synthesis_pb2.CompileResponse,
-                 result: delay_model_pb2.DataPoint):
-  """Extracts area from the server response and writes it to the datapoint."""
-  cell_histogram = response.instance_count.cell_histogram
-  if 'SB_LUT4' in cell_histogram:
-    result.delay = cell_histogram['SB_LUT4']
-  else:
-    result.delay = 0
+
+def _strip_response(
+    response: synthesis_pb2.CompileResponse) -> synthesis_pb2.CompileResponse:
+  """Returns a copy of 'response' with only the fields used in this file.
+
+  Responses may include large netlists and place-and-route results which are
+  not worth keeping in the caches.
+
+  Args:
+    response: Server response to strip.
+  """
+  stripped = synthesis_pb2.CompileResponse()
+  for module_name, instance_count in response.module_instance_counts.items():
+    stripped.module_instance_counts[module_name].CopyFrom(instance_count)
+  return stripped
+
+
+def _synth(
+    stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
+    requests: Iterable[synthesis_pb2.CompileRequest]
+) -> List[synthesis_pb2.CompileResponse]:
+  """Synthesizes the given modules, reusing previous results where possible.
+
+  'requests' is consumed lazily, so modules which are still being generated are
+  generated while requests for earlier modules are in flight.
+
+  Args:
+    stub: Handle to the synthesis server.
+    requests: Request to synthesize each module.
+
+  Returns:
+    Server response for each request, in the same order as 'requests'. Only
+    module_instance_counts is populated.
+  """
+  keys = []
+  uncached_keys = []
+  uncached_key_set = set()
+
+  def _uncached_requests():
+    for request in requests:
+      key = _synthesis_cache_key(request)
+      keys.append(key)
+      if key in _synthesis_cache or key in uncached_key_set:
+        continue
+      if _persistent_synthesis_cache is not None:
+        with _persistent_synthesis_cache_lock:
+          serialized_response = _persistent_synthesis_cache.get(key)
+        if serialized_response is not None:
+          _synthesis_cache[key] = synthesis_pb2.CompileResponse.FromString(
+              serialized_response)
+          continue
+      uncached_keys.append(key)
+      uncached_key_set.add(key)
+      yield request
+
+  responses = _synth_uncached(stub, _uncached_requests())
+  for key, response in zip(uncached_keys, responses):
+    response = _strip_response(response)
+    _synthesis_cache[key] = response
+    if _persistent_synthesis_cache is not None:
+      with _persistent_synthesis_cache_lock:
+        _persistent_synthesis_cache[key] = response.SerializeToString()
+
+  return [_synthesis_cache[key] for key in keys]
+
+
+def _synth_uncached(
+    stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
+    requests: Iterable[synthesis_pb2.CompileRequest]
+) -> List[synthesis_pb2.CompileResponse]:
+  """Synthesizes the given modules with concurrent batched requests.
+
+  The requests are split into batches of at most --batch_size requests. Each
+  batch is requested asynchronously as soon as it is complete, with at most
+  --max_in_flight_requests requests outstanding at once across all sweeps.
+
+  Args:
+    stub: Handle to the synthesis server.
+    requests: Request to synthesize each module.
+
+  Returns:
+    Server response for each request, in the same order as 'requests'.
+  """
+  response_futures = []
+
+  def _send(batch_request: synthesis_pb2.BatchCompileRequest):
+    logging.vlog(3, '--- Request')
+    logging.vlog(3, batch_request)
+    _in_flight_requests.acquire()
+    response_future = stub.BatchCompile.future(batch_request)
+    response_future.add_done_callback(lambda _: _in_flight_requests.release())
+    response_futures.append(response_future)
+
+  # Only the instance counts are used, so do not transfer the netlists.
+  batch_request = synthesis_pb2.BatchCompileRequest(omit_netlists=True)
+  for request in requests:
+    batch_request.requests.append(request)
+    if len(batch_request.requests) == FLAGS.batch_size:
+      _send(batch_request)
+      batch_request = synthesis_pb2.BatchCompileRequest(omit_netlists=True)
+  if batch_request.requests:
+    _send(batch_request)
+
+  return [
+      response for response_future in response_futures
+      for response in response_future.result().responses
+  ]
+
+
+def _min_bit_count_unsigned(value: int) -> int:
+  """Returns the minimum number of bits required to store 'value' unsigned."""
+  return value.bit_length()
+
+
+def _get_bits_type(bit_count: int) -> str:
+  """Return the bits type with 'bit_count' bits."""
+  if bit_count < len(_BITS_TYPES):
+    return _BITS_TYPES[bit_count]
+  return f'bits[{bit_count}]'
 
 
 def _get_type_from_dimensions(dimensions: List[int]):
@@ -221,26 +388,25 @@ def _get_type_from_dimensions(dimensions: List[int]):
   return bits_type
 
 
-def _synthesize_op_and_make_bare_data_point(
+def _get_module_name_safe_type(type_str: str) -> str:
+  return type_str.replace('[', '_').replace(']', '')
+
+
+def _prepare_sub_module(
     op: str,
-    kop: str,
     op_type: str,
     operand_types: List[str],
-    stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
     attributes: Sequence[Tuple[str, str]] = (),
-    literal_operand: Optional[int] = None) -> delay_model_pb2.DataPoint:
-  """Characterize an operation via synthesis server.
+    literal_operand: Optional[int] = None) -> Tuple[str, str]:
+  """Generates the IR of a module used to characterize an operation.
 
-  Sets the area and op of the data point but not any other information about the
-  node / operands.
+  The name of the module is unique to the operation and its types and
+  attributes, so modules with the same name are interchangeable.
 
   Args:
     op: Operation name to use for generating an IR package; e.g. 'add'.
-    kop: Operation name to emit into datapoints, generally in kConstant form for
-      use in the delay model; e.g. 'kAdd'.
     op_type: The type of the operation result.
     operand_types: The type of each operation.
-    stub: Handle to the synthesis server.
     attributes: Attributes to include in the operation mnemonic. For example,
       "new_bit_count" in extend operations. Forwarded to generate_ir_package.
     literal_operand: Optionally specifies that the given operand number should
@@ -248,50 +414,110 @@ def _synthesize_op_and_make_bare_data_point(
       parameter. Forwarded to generate_ir_package.
 
   Returns:
-    datapoint produced via the synthesis server with the area and op (but no
-    other fields)
-    set.
-
+    (module_name, ir_text) pair of the module.
   """
   ir_text = op_module_generator.generate_ir_package(op, op_type, operand_types,
-                                                    attributes, literal_operand)
-  module_name_safe_op_type = op_type.replace('[', '_').replace(']', '')
-  module_name = f'{op}_{module_name_safe_op_type}'
-  mod_generator_result = op_module_generator.generate_verilog_module(
-      module_name, ir_text)
-  top_name = module_name + '_wrapper'
-  verilog_text = op_module_generator.generate_parallel_module(
-      [mod_generator_result], top_name)
-
-  response = _synth(stub, verilog_text, top_name)
+                                                   attributes, literal_operand)
+  name_parts = [op, _get_module_name_safe_type(op_type)]
+  name_parts.extend(
+      _get_module_name_safe_type(operand_type)
+      for operand_type in operand_types)
+  name_parts.extend(f'{key}_{value}' for key, value in attributes)
+  if literal_operand is not None:
+    name_parts.append(f'literal_{literal_operand}')
+  return '_'.join(name_parts), ir_text
+
+
+def _synth_sub_modules(
+    stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
+    sub_modules: Sequence[Tuple[str, str]]
+) -> List[synthesis_pb2.InstanceCount]:
+  """Synthesizes the given modules packed into parallel wrapper modules.
+
+  Up to --ops_per_module distinct modules are instantiated in each wrapper
+  module, and the area of each is taken from the per-module instance counts
+  reported by the synthesis server.
+
+  Args:
+    stub: Handle to the synthesis server.
+    sub_modules: (module_name, ir_text) pair for each module to synthesize.
+
+  Returns:
+    Instance count of each module, in the same order as 'sub_modules'.
+  """
+  # Modules with the same name are interchangeable; synthesize each once.
+  unique_sub_modules = list(dict(sub_modules).items())
+  chunks = [
+      tuple(unique_sub_modules[chunk_start:chunk_start + FLAGS.ops_per_module])
+      for chunk_start in range(0, len(unique_sub_modules), FLAGS.ops_per_module)
+  ]
+  # Generate the wrapper modules lazily to overlap generation with synthesis.
+  def _wrapper_requests():
+    for chunk in chunks:
+      request = synthesis_pb2.CompileRequest()
+      request.top_module_name = chunk[0][0] + '_wrapper'
+      request.module_text = op_module_generator.generate_parallel_module([
+          op_module_generator.generate_verilog_module(module_name, ir_text)
+          for module_name, ir_text in chunk
+      ], request.top_module_name)
+      request.preserve_hierarchy = True
+      yield request
+
+  instance_counts = {}
+  for chunk, response in zip(chunks, _synth(stub, _wrapper_requests())):
+    for module_name, _ in chunk:
+      # Indexing the map would silently insert an empty instance count.
+      if module_name not in response.module_instance_counts:
+        raise ValueError(
+            f'Synthesis server did not report the instance counts of module '
+            f'{module_name}; does it support preserve_hierarchy?')
+      instance_counts[module_name] = response.module_instance_counts[
+          module_name]
+  return [instance_counts[module_name] for module_name, _ in sub_modules]
+
+
+def _finalize_data_point(instance_count: synthesis_pb2.InstanceCount,
+                         kop: str) -> delay_model_pb2.DataPoint:
+  """Makes a bare datapoint from the synthesized instance count of an operation.
+
+  Sets the area and op of the data point but not any other information about the
+  node / operands.
+
+  Args:
+    instance_count: Instance count of the module characterizing the operation.
+    kop: Operation name to emit into datapoints, generally in kConstant form for
+      use in the delay model; e.g. 'kAdd'.
+
+  Returns:
+    datapoint with the area and op (but no other fields) set.
+  """
   result = delay_model_pb2.DataPoint()
-  _record_area(response, result)
+  result.delay = instance_count.cell_histogram.get('SB_LUT4', 0)
   result.operation.op = kop
-
   return result
 
 
-def _build_data_point(
+def _build_data_points(
     op: str,
     kop: str,
-    node_dimensions: List[int],
-    operand_dimensions: List[List[int]],
+    shapes: Sequence[Tuple[List[int], List[List[int]]]],
     stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
     attributes: Sequence[Tuple[str, str]] = (),
-    literal_operand: Optional[int] = None) -> delay_model_pb2.DataPoint:
-  """Characterize an operation via synthesis server.
+    literal_operand: Optional[int] = None
+) -> Iterator[delay_model_pb2.DataPoint]:
+  """Characterize an operation at each of the given shapes via synthesis server.
 
-  Sets the area and op of the data point but not any other information about the
-  node / operands.
+  All shapes are synthesized together (see _synth_sub_modules). Sets the area
+  and op of the data points but not any other information about the node /
+  operands.
 
   Args:
     op: Operation name to use for generating an IR package; e.g. 'add'.
     kop: Operation name to emit into datapoints, generally in kConstant form for
       use in the delay model; e.g. 'kAdd'.
-    node_dimensions: The dimensions of the operation result (bits type or nested
-      array of bits).
-    operand_dimensions: The dimensions of each operation (bits type or nested
-      array of bits).
+    shapes: (node_dimensions, operand_dimensions) for each datapoint; the
+      dimensions of the operation result and of each operand (bits type or
+      nested array of bits).
     stub: Handle to the synthesis server.
     attributes: Attributes to include in the operation mnemonic. For example,
       "new_bit_count" in extend operations. Forwarded to generate_ir_package.
@@ -299,77 +525,98 @@ def _build_data_point(
       be substituted with a randomly generated literal instead of a function
       parameter. Forwarded to generate_ir_package:
 
-  Returns:
-    datapoint produced via the synthesis server with the area and op (but no
-    other fields)
-    set.
+  Yields:
+    datapoints produced via the synthesis server with the area and op (but no
+    other fields) set, in the same order as 'shapes'.
   """
-  op_type = _get_type_from_dimensions(node_dimensions)
-  operand_types = []
-  for operand_dims in operand_dimensions:
-    operand_types.append(_get_type_from_dimensions(operand_dims))
+  sub_modules = []
+  for node_dimensions, operand_dimensions in shapes:
+    op_type = _get_type_from_dimensions(node_dimensions)
+    operand_types = []
+    for operand_dims in operand_dimensions:
+      operand_types.append(_get_type_from_dimensions(operand_dims))
+    sub_modules.append(
+        _prepare_sub_module(op, op_type, operand_types, attributes,
+                            literal_operand))
 
-  result = _synthesize_op_and_make_bare_data_point(op, kop, op_type,
-                                                   operand_types, stub,
-                                                   attributes, literal_operand)
-  return result
+  for instance_count in _synth_sub_modules(stub, sub_modules):
+    yield _finalize_data_point(instance_count, kop)
+
+
+@dataclasses.dataclass(frozen=True)
+class _BitTypesShape:
+  """Shape of an operation with bit type input and output.
+
+  Attributes:
+    num_node_bits: The number of bits of the operation result.
+    num_operand_bits: The number of bits of each operand.
+    attributes: Attributes to include in the operation mnemonic. For example,
+      "new_bit_count" in extend operations.
+  """
+  num_node_bits: int
+  num_operand_bits: Tuple[int, ...]
+  attributes: Tuple[Tuple[str, str], ...] = ()
 
 
-def _build_data_point_bit_types(
+def _build_data_points_bit_types(
     op: str,
     kop: str,
-    num_node_bits: int,
-    num_operand_bits: List[int],
+    shapes: Sequence[_BitTypesShape],
     stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
-    attributes: Sequence[Tuple[str, str]] = (),
-    literal_operand: Optional[int] = None) -> delay_model_pb2.DataPoint:
+    literal_operand: Optional[int] = None
+) -> Iterator[delay_model_pb2.DataPoint]:
   """Characterize an operation with bit type input and output via synthesis server.
 
+  All shapes are synthesized together (see _synth_sub_modules).
+
   Args:
     op: Operation name to use for generating an IR package; e.g. 'add'.
     kop: Operation name to emit into datapoints, generally in kConstant form for
       use in the delay model; e.g. 'kAdd'.
-    num_node_bits: The number of bits of the operation result.
-    num_operand_bits: The number of bits of each operation.
+    shapes: The shape of the operation for each datapoint.
     stub: Handle to the synthesis server.
-    attributes: Attributes to include in the operation mnemonic. For example,
-      "new_bit_count" in extend operations. Forwarded to generate_ir_package.
     literal_operand: Optionally specifies that the given operand number should
       be substituted with a randomly generated literal instead of a function
       parameter. Forwarded to generate_ir_package.
 
-  Returns:
-    Complete datapoint for the op, including bitwidths of tehe node and
-    operands.
+  Yields:
+    Complete datapoints for the op, including bitwidths of the node and
+    operands, in the same order as 'shapes'.
   """
-  op_type = _get_type_from_dimensions([num_node_bits])
-  operand_types = []
-  for operand_bit_count in num_operand_bits:
-    operand_types.append(_get_type_from_dimensions([operand_bit_count]))
-
-  result = _synthesize_op_and_make_bare_data_point(op, kop, op_type,
-                                                   operand_types, stub,
-                                                   attributes, literal_operand)
-  result.operation.bit_count = num_node_bits
-  for operand_bit_count in num_operand_bits:
-    operand = result.operation.operands.add()
-    operand.bit_count = operand_bit_count
-  return result
+  sub_modules = []
+  for shape in shapes:
+    op_type = _get_bits_type(shape.num_node_bits)
+    operand_types = [
+        _get_bits_type(operand_bit_count)
+        for operand_bit_count in shape.num_operand_bits
+    ]
+    sub_modules.append(
+        _prepare_sub_module(op, op_type, operand_types, shape.attributes,
+                            literal_operand))
+
+  for shape, instance_count in zip(shapes,
+                                   _synth_sub_modules(stub, sub_modules)):
+    result = _finalize_data_point(instance_count, kop)
+    result.operation.bit_count = shape.num_node_bits
+    result.operation.operands.extend(
+        delay_model_pb2.Operation.Operand(bit_count=operand_bit_count)
+        for operand_bit_count in shape.num_operand_bits)
+    yield result
 
 
 def _run_nary_op(op: str, kop: str,
                  stub: synthesis_service_pb2_grpc.SynthesisServiceStub,
-                 num_inputs: int) -> List[delay_model_pb2.DataPoint]:
-  """Characterizes an nary op."""
-  results = []
-  for bit_count in _bitwidth_sweep(0):
-    results.append(
-        _build_data_point_bit_types(op, kop, bit_count,
-                                    [bit_count] * num_inputs, stub))
-    logging.info('# nary_op: %s, %s bits, %s inputs --> %s', op, str(bit_count),
-                 str(num_inputs), str(results[-1].delay))
-
-  return results
+                 num_inputs: int) -> Iterator[delay_model_pb2.DataPoint]:
+  """Characterizes an nary op, yielding each datapoint."""
+  shapes = [
+      _BitTypesShape(bit_count, (bit_count,) * num_inputs)
+      for bit_count in _bitwidth_sweep(0)
+  ]
+  for shape, result in zip(shapes,
+                           _build_data_points_bit_types(op, kop, shapes, stub)):
+    logging.info('# nary_op: %s, %d bits, %d inputs --> %d', op,
+                 shape.num_node_bits, num_inputs, result.delay)
+    yield result
 
 
 def _run_linear_bin_op_and_add(
@@ -451,11 +698,15 @@ def _run_single_bit_result_op_and_add(
   """Runs characterization for an op that always produce a single-bit output."""
   _new_regression_op_model(model, kop, operand_bit_counts=[0])
 
-  for input_bits in _bitwidth_sweep(0):
-    logging.info('# reduction_op: %s, %s bits', op, str(input_bits))
-    model.data_points.append(
-        _build_data_point_bit_types(op, kop, 1, [input_bits] * num_inputs,
-                                    stub))
+  shapes = [
+      _BitTypesShape(1, (input_bits,) * num_inputs)
+      for input_bits in _bitwidth_sweep(0)
+  ]
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    logging.info('# reduction_op: %s, %d bits --> %d', op,
+                 shape.num_operand_bits[0], result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -489,22 +740,27 @@ def _run_select_op_and_add(
   # Enumerate cases and bitwidth.
   # Note: at 7 and 8 cases, there is a weird dip in LUTs at around 40 bits wide
   # Why? No idea...
-  for num_cases in _operand_count_sweep():
-    for bit_count in _bitwidth_sweep(0):
-
-      # Handle differently if num_cases is a power of 2.
-      select_bits = bits.min_bit_count_unsigned(num_cases - 1)
-      if math.pow(2, select_bits) == num_cases:
-        model.data_points.append(
-            _build_data_point_bit_types(op, kop, bit_count, [select_bits] +
-                                        ([bit_count] * num_cases), stub))
-      else:
-        model.data_points.append(
-            _build_data_point_bit_types(op, kop, bit_count, [select_bits] +
-                                        ([bit_count] * (num_cases + 1)), stub))
-        logging.info('# select_op: %s, %s bits, %s cases --> %s', op,
-                     str(bit_count), str(num_cases),
-                     str(model.data_points[-1].delay))
+  # Case counts keyed by shape. Distinct case counts may produce the same shape,
+  # which only needs to be characterized once.
+  case_counts = {}
+  for num_cases, bit_count in itertools.product(_operand_count_sweep(),
+                                                _bitwidth_sweep(0)):
+    # Handle differently if num_cases is a power of 2.
+    select_bits = _min_bit_count_unsigned(num_cases - 1)
+    if (num_cases & (num_cases - 1)) == 0:
+      shape = _BitTypesShape(bit_count,
+                             (select_bits,) + ((bit_count,) * num_cases))
+    else:
+      shape = _BitTypesShape(bit_count,
+                             (select_bits,) + ((bit_count,) * (num_cases + 1)))
+    case_counts.setdefault(shape, num_cases)
+
+  shapes = list(case_counts)
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    logging.info('# select_op: %s, %d bits, %d cases --> %d', op,
+                 shape.num_node_bits, case_counts[shape], result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -523,16 +779,17 @@ def _run_one_hot_select_op_and_add(
   _set_result_bit_count_expression_factor(expr.rhs_expression)
 
   # Enumerate cases and bitwidth.
-  for num_cases in _operand_count_sweep():
-    for bit_count in _bitwidth_sweep(0):
-      select_bits = num_cases
-      model.data_points.append(
-          _build_data_point_bit_types(op, kop, bit_count,
-                                      [select_bits] + ([bit_count] * num_cases),
-                                      stub))
-      logging.info('# one_hot_select_op: %s, %s bits, %s cases --> %s', op,
-                   str(bit_count), str(num_cases),
-                   str(model.data_points[-1].delay))
+  shapes = [
+      _BitTypesShape(bit_count, (num_cases,) + ((bit_count,) * num_cases))
+      for num_cases, bit_count in itertools.product(_operand_count_sweep(),
+                                                    _bitwidth_sweep(0))
+  ]
+
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    logging.info('# one_hot_select_op: %s, %d bits, %d cases --> %d', op,
+                 shape.num_node_bits, shape.num_operand_bits[0], result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -545,12 +802,16 @@ def _run_encode_op_and_add(
   _new_regression_op_model(model, kop, operand_bit_counts=[0])
 
   # input_bits should be at least 2 bits.
+  shapes = []
   for input_bits in _bitwidth_sweep(0):
-    node_bits = bits.min_bit_count_unsigned(input_bits - 1)
-    model.data_points.append(
-        _build_data_point_bit_types(op, kop, node_bits, [input_bits], stub))
-    logging.info('# encode_op: %s, %s input bits --> %s', op, str(input_bits),
-                 str(model.data_points[-1].delay))
+    node_bits = _min_bit_count_unsigned(input_bits - 1)
+    shapes.append(_BitTypesShape(node_bits, (input_bits,)))
+
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    logging.info('# encode_op: %s, %d input bits --> %d', op,
+                 shape.num_operand_bits[0], result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -563,17 +824,18 @@ def _run_decode_op_and_add(
   _new_regression_op_model(model, kop, result_bit_count=True)
 
   # node_bits should be at least 2 bits.
+  shapes = []
   for node_bits in _bitwidth_sweep(0):
-    input_bits = bits.min_bit_count_unsigned(node_bits - 1)
-    model.data_points.append(
-        _build_data_point_bit_types(
-            op,
-            kop,
-            node_bits, [input_bits],
-            stub,
-            attributes=[('width', str(node_bits))]))
-    logging.info('# encode_op: %s, %s bits --> %s', op, str(node_bits),
-                 str(model.data_points[-1].delay))
+    input_bits = _min_bit_count_unsigned(node_bits - 1)
+    shapes.append(
+        _BitTypesShape(node_bits, (input_bits,),
+                       (('width', str(node_bits)),)))
+
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    logging.info('# encode_op: %s, %d bits --> %d', op, shape.num_node_bits,
+                 result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -596,22 +858,22 @@ def _run_dynamic_bit_slice_op_and_add(
   _set_operand_bit_count_expression_factor(mul_expr.rhs_expression, 1)
 
   # input_bits should be at least 2 bits
-  idx = 0
+  shapes = []
   for input_bits in _bitwidth_sweep(2):
-    for start_bits in range(3, bits.min_bit_count_unsigned(input_bits - 1) + 1):
+    for start_bits in range(3, _min_bit_count_unsigned(input_bits - 1) + 1):
       for node_bits in range(1, input_bits, BITWIDTH_STRIDE_DEGREES[2]):
-        model.data_points.append(
-            _build_data_point_bit_types(
-                op,
-                kop,
-                node_bits, [input_bits, start_bits],
-                stub,
-                attributes=[('width', str(node_bits))]))
-        logging.info(
-            '# idx: %s, dynamic_bit_slice_op: %s, %s start bits, '
-            '%s input bits, %s width --> %s', str(idx), op, str(start_bits),
-            str(input_bits), str(node_bits), str(model.data_points[-1].delay))
-        idx = idx + 1
+        shapes.append(
+            _BitTypesShape(node_bits, (input_bits, start_bits),
+                           (('width', str(node_bits)),)))
+
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for idx, (shape, result) in enumerate(zip(shapes, results)):
+    input_bits, start_bits = shape.num_operand_bits
+    logging.info(
+        '# idx: %d, dynamic_bit_slice_op: %s, %d start bits, '
+        '%d input bits, %d width --> %d', idx, op, start_bits, input_bits,
+        shape.num_node_bits, result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -633,17 +895,16 @@ def _run_one_hot_op_and_add(
   _set_operand_bit_count_expression_factor(expr.lhs_expression, 0)
   _set_operand_bit_count_expression_factor(expr.rhs_expression, 0)
 
-  for bit_count in _bitwidth_sweep(0):
-    # lsb / msb priority or the same logic but mirror image.
-    model.data_points.append(
-        _build_data_point_bit_types(
-            op,
-            kop,
-            bit_count + 1, [bit_count],
-            stub,
-            attributes=[('lsb_prio', 'true')]))
-    logging.info('# one_hot: %s, %s input bits --> %s', op, str(bit_count),
-                 str(model.data_points[-1].delay))
+  # lsb / msb priority or the same logic but mirror image.
+  shapes = [
+      _BitTypesShape(bit_count + 1, (bit_count,), (('lsb_prio', 'true'),))
+      for bit_count in _bitwidth_sweep(0)
+  ]
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    logging.info('# one_hot: %s, %d input bits --> %d', op,
+                 shape.num_operand_bits[0], result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -842,15 +1103,18 @@ def _run_mul_op_and_add(
   inner_add_expr.rhs_expression.CopyFrom(region_a_area_expr)
 
   # All bit counts should be at least 2
-  for mplier_count in _bitwidth_sweep(2):
-    for mcand_count in _bitwidth_sweep(2):
-      for node_count in _bitwidth_sweep(2):
-        model.data_points.append(
-            _build_data_point_bit_types(op, kop, node_count,
-                                        [mplier_count, mcand_count], stub))
-        logging.info('# mul: %s, %s * %s, %s node count, result_bits --> %s',
-                     op, str(mplier_count), str(mcand_count), str(node_count),
-                     str(model.data_points[-1].delay))
+  shapes = [
+      _BitTypesShape(node_count, (mplier_count, mcand_count))
+      for mplier_count, mcand_count, node_count in itertools.product(
+          _bitwidth_sweep(2), _bitwidth_sweep(2), _bitwidth_sweep(2))
+  ]
+
+  results = _build_data_points_bit_types(op, kop, shapes, stub)
+  for shape, result in zip(shapes, results):
+    mplier_count, mcand_count = shape.num_operand_bits
+    logging.info('# mul: %s, %d * %d, %d node count, result_bits --> %d', op,
+                 mplier_count, mcand_count, shape.num_node_bits, result.delay)
+    model.data_points.append(result)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -937,6 +1201,7 @@ def _run_array_index_op_and_add(
   _set_addressable_element_count_expression(mul_expr.lhs_expression)
   _set_result_bit_count_expression_factor(mul_expr.rhs_expression)
 
+  shapes = []
   for num_dims in range(1, 3):
     for array_dimension_sizes in _yield_array_dimension_sizes(num_dims):
 
@@ -952,20 +1217,20 @@ def _run_array_index_op_and_add(
         # Format dimension args
         operand_dimensions = [array_and_element_dimensions]
         for dim in reversed(array_dimension_sizes):
-          operand_dimensions.append([bits.min_bit_count_unsigned(dim - 1)])
+          operand_dimensions.append([_min_bit_count_unsigned(dim - 1)])
 
-        # Record data point
-        result = _build_data_point(op, kop, [element_bit_count],
-                                   operand_dimensions, stub)
-        result.operation.bit_count = element_bit_count
-        operand = result.operation.operands.add()
-        operand.bit_count = functools.reduce(operator.mul,
-                                             array_and_element_dimensions, 1)
-        model.data_points.append(result)
+        shapes.append(([element_bit_count], operand_dimensions))
 
-        logging.info('%s: %s --> %s', str(kop),
-                     ','.join(str(item) for item in operand_dimensions),
-                     str(result.delay))
+  # Record data points
+  for (node_dimensions, operand_dimensions), result in zip(
+      shapes, _build_data_points(op, kop, shapes, stub)):
+    result.operation.bit_count = node_dimensions[0]
+    result.operation.operands.append(
+        delay_model_pb2.Operation.Operand(
+            bit_count=functools.reduce(operator.mul, operand_dimensions[0], 1)))
+    model.data_points.append(result)
+
+    logging.info('%s: %s --> %d', kop, operand_dimensions, result.delay)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -998,6 +1263,7 @@ def _run_array_update_op_and_add(
   _set_addressable_element_count_expression(mul_expr.lhs_expression)
   _set_operand_bit_count_expression_factor(mul_expr.rhs_expression, 1)
 
+  shapes = []
   for num_dims in range(1, 3):
     for array_dimension_sizes in _yield_array_dimension_sizes(num_dims):
 
@@ -1014,21 +1280,25 @@ def _run_array_update_op_and_add(
         operand_dimensions = [array_and_element_dimensions]
         operand_dimensions.append([element_bit_count])
         for dim in reversed(array_dimension_sizes):
-          operand_dimensions.append([bits.min_bit_count_unsigned(dim - 1)])
-
-        # Record data point
-        result = _build_data_point(op, kop, array_and_element_dimensions,
-                                   operand_dimensions, stub)
-        array_operand = result.operation.operands.add()
-        array_operand.bit_count = functools.reduce(
-            operator.mul, array_and_element_dimensions, 1)
-        new_elm_operand = result.operation.operands.add()
-        new_elm_operand.bit_count = element_bit_count
-        model.data_points.append(result)
-
-        logging.info('%s: %s --> %s', str(kop),
-                     ','.join(str(item) for item in operand_dimensions),
-                     str(result.delay))
+          operand_dimensions.append([_min_bit_count_unsigned(dim - 1)])
+
+        shapes.append((array_and_element_dimensions, operand_dimensions))
+
+  # Record data points
+  for (array_and_element_dimensions, operand_dimensions), result in zip(
+      shapes, _build_data_points(op, kop, shapes, stub)):
+    result.operation.operands.extend([
+        # Array operand.
+        delay_model_pb2.Operation.Operand(
+            bit_count=functools.reduce(operator.mul,
+                                       array_and_element_dimensions, 1)),
+        # New element operand.
+        delay_model_pb2.Operation.Operand(
+            bit_count=array_and_element_dimensions[0]),
+    ])
+    model.data_points.append(result)
+
+    logging.info('%s: %s --> %d', kop, operand_dimensions, result.delay)
 
   # Validate model
   delay_model.DelayModel(model)
@@ -1036,80 +1306,106 @@ def _run_array_update_op_and_add(
 
 def run_characterization(
     stub: synthesis_service_pb2_grpc.SynthesisServiceStub) -> None:
-  """Runs characterization via 'stub', DelayModel to stdout as prototext."""
-  model = delay_model_pb2.DelayModel()
+  """Runs characterization via 'stub', DelayModel to stdout as prototext.
 
-  # Bin ops
-  _run_linear_bin_op_and_add('add', 'kAdd', model, stub)
-  _run_linear_bin_op_and_add('sub', 'kSub', model, stub)
-  # Observed shift data is noisy.
-  _run_linear_bin_op_and_add('shll', 'kShll', model, stub)
-  _run_linear_bin_op_and_add('shrl', 'kShrl', model, stub)
-  _run_linear_bin_op_and_add('shra', 'kShra', model, stub)
-
-  _run_quadratic_bin_op_and_add('sdiv', 'kSDiv', model, stub, signed=True)
-  _run_quadratic_bin_op_and_add('smod', 'kSMod', model, stub, signed=True)
-  _run_quadratic_bin_op_and_add('udiv', 'kUDiv', model, stub)
-  _run_quadratic_bin_op_and_add('umod', 'kUMod', model, stub)
-
-  # Unary ops
-  _run_unary_op_and_add('neg', 'kNeg', model, stub, signed=True)
-  _run_unary_op_and_add('not', 'kNot', model, stub)
-
-  # Nary ops
-  _run_nary_op_and_add('and', 'kAnd', model, stub)
-  _run_nary_op_and_add('nand', 'kNand', model, stub)
-  _run_nary_op_and_add('nor', 'kNor', model, stub)
-  _run_nary_op_and_add('or', 'kOr', model, stub)
-  _run_nary_op_and_add('xor', 'kXor', model, stub)
-
-  # Reduction ops
-  _run_reduction_op_and_add('and_reduce', 'kAndReduce', model, stub)
-  _run_reduction_op_and_add('or_reduce', 'kOrReduce', model, stub)
-  _run_reduction_op_and_add('xor_reduce', 'kXorReduce', model, stub)
-
-  # Comparison ops
-  _run_comparison_op_and_add('eq', 'kEq', model, stub)
-  _run_comparison_op_and_add('ne', 'kNe', model, stub)
-  # Note: Could optimize for sign - accuracy gains from
-  # sign have been marginal so far, though. These ops
-  # also cost less than smul / sdiv anyway.
-  _run_comparison_op_and_add('sge', 'kSGe', model, stub)
-  _run_comparison_op_and_add('sgt', 'kSGt', model, stub)
-  _run_comparison_op_and_add('sle', 'kSLe', model, stub)
-  _run_comparison_op_and_add('slt', 'kSLt', model, stub)
-  _run_comparison_op_and_add('uge', 'kUGe', model, stub)
-  _run_comparison_op_and_add('ugt', 'kUGt', model, stub)
-  _run_comparison_op_and_add('ule', 'kULe', model, stub)
-  _run_comparison_op_and_add('ult', 'kULt', model, stub)
-
-  # Select ops
-  # For functions only called for 1 op, could just encode
-  # op and kOp into function.  However, perfer consistency
-  # and readability of passing them in as args.
-  # Note: Select op observed data is really weird, see _run_select_op_and_add
-  _run_select_op_and_add('sel', 'kSel', model, stub)
-  _run_one_hot_select_op_and_add('one_hot_sel', 'kOneHotSel', model, stub)
-
-  # Encode ops
-  _run_encode_op_and_add('encode', 'kEncode', model, stub)
-  _run_decode_op_and_add('decode', 'kDecode', model, stub)
-
-  # Dynamic bit slice op
-  _run_dynamic_bit_slice_op_and_add('dynamic_bit_slice', 'kDynamicBitSlice',
-                                    model, stub)
-
-  # One hot op
-  _run_one_hot_op_and_add('one_hot', 'kOneHot', model, stub)
-
-  # Mul ops
-  # Note: Modeling smul w/ sign bit as with sdiv decreases accuracy.
-  _run_mul_op_and_add('smul', 'kSMul', model, stub)
-  _run_mul_op_and_add('umul', 'kUMul', model, stub)
-
-  # Array ops
-  _run_array_index_op_and_add('array_index', 'kArrayIndex', model, stub)
-  _run_array_update_op_and_add('array_update', 'kArrayUpdate', model, stub)
+  The sweeps run concurrently so their requests share the synthesis server.
+  Each sweep adds to a model of its own, and these are merged in the order the
+  sweeps are listed so the output does not depend on the order they finish.
+
+  Args:
+    stub: Handle to the synthesis server.
+  """
+  global _in_flight_requests
+  _in_flight_requests = threading.BoundedSemaphore(FLAGS.max_in_flight_requests)
+
+  model = delay_model_pb2.DelayModel()
+  with futures.ThreadPoolExecutor(
+      max_workers=FLAGS.max_in_flight_requests) as executor:
+    sweeps = []
+
+    def _submit(run_op_and_add, op: str, kop: str, **kwargs):
+      """Starts running a sweep which adds to a model of its own."""
+      sweep_model = delay_model_pb2.DelayModel()
+      sweeps.append((sweep_model,
+                     executor.submit(run_op_and_add, op, kop, sweep_model, stub,
+                                     **kwargs)))
+
+    # Bin ops
+    _submit(_run_linear_bin_op_and_add, 'add', 'kAdd')
+    _submit(_run_linear_bin_op_and_add, 'sub', 'kSub')
+    # Observed shift data is noisy.
+    _submit(_run_linear_bin_op_and_add, 'shll', 'kShll')
+    _submit(_run_linear_bin_op_and_add, 'shrl', 'kShrl')
+    _submit(_run_linear_bin_op_and_add, 'shra', 'kShra')
+
+    _submit(_run_quadratic_bin_op_and_add, 'sdiv', 'kSDiv', signed=True)
+    _submit(_run_quadratic_bin_op_and_add, 'smod', 'kSMod', signed=True)
+    _submit(_run_quadratic_bin_op_and_add, 'udiv', 'kUDiv')
+    _submit(_run_quadratic_bin_op_and_add, 'umod', 'kUMod')
+
+    # Unary ops
+    _submit(_run_unary_op_and_add, 'neg', 'kNeg', signed=True)
+    _submit(_run_unary_op_and_add, 'not', 'kNot')
+
+    # Nary ops
+    _submit(_run_nary_op_and_add, 'and', 'kAnd')
+    _submit(_run_nary_op_and_add, 'nand', 'kNand')
+    _submit(_run_nary_op_and_add, 'nor', 'kNor')
+    _submit(_run_nary_op_and_add, 'or', 'kOr')
+    _submit(_run_nary_op_and_add, 'xor', 'kXor')
+
+    # Reduction ops
+    _submit(_run_reduction_op_and_add, 'and_reduce', 'kAndReduce')
+    _submit(_run_reduction_op_and_add, 'or_reduce', 'kOrReduce')
+    _submit(_run_reduction_op_and_add, 'xor_reduce', 'kXorReduce')
+
+    # Comparison ops
+    _submit(_run_comparison_op_and_add, 'eq', 'kEq')
+    _submit(_run_comparison_op_and_add, 'ne', 'kNe')
+    # Note: Could optimize for sign - accuracy gains from
+    # sign have been marginal so far, though. These ops
+    # also cost less than smul / sdiv anyway.
+    _submit(_run_comparison_op_and_add, 'sge', 'kSGe')
+    _submit(_run_comparison_op_and_add, 'sgt', 'kSGt')
+    _submit(_run_comparison_op_and_add, 'sle', 'kSLe')
+    _submit(_run_comparison_op_and_add, 'slt', 'kSLt')
+    _submit(_run_comparison_op_and_add, 'uge', 'kUGe')
+    _submit(_run_comparison_op_and_add, 'ugt', 'kUGt')
+    _submit(_run_comparison_op_and_add, 'ule', 'kULe')
+    _submit(_run_comparison_op_and_add, 'ult', 'kULt')
+
+    # Select ops
+    # For functions only called for 1 op, could just encode
+    # op and kOp into function.  However, perfer consistency
+    # and readability of passing them in as args.
+    # Note: Select op observed data is really weird, see
+    # _run_select_op_and_add
+    _submit(_run_select_op_and_add, 'sel', 'kSel')
+    _submit(_run_one_hot_select_op_and_add, 'one_hot_sel', 'kOneHotSel')
+
+    # Encode ops
+    _submit(_run_encode_op_and_add, 'encode', 'kEncode')
+    _submit(_run_decode_op_and_add, 'decode', 'kDecode')
+
+    # Dynamic bit slice op
+    _submit(_run_dynamic_bit_slice_op_and_add, 'dynamic_bit_slice',
+            'kDynamicBitSlice')
+
+    # One hot op
+    _submit(_run_one_hot_op_and_add, 'one_hot', 'kOneHot')
+
+    # Mul ops
+    # Note: Modeling smul w/ sign bit as with sdiv decreases accuracy.
+    _submit(_run_mul_op_and_add, 'smul', 'kSMul')
+    _submit(_run_mul_op_and_add, 'umul', 'kUMul')
+
+    # Array ops
+    _submit(_run_array_index_op_and_add, 'array_index', 'kArrayIndex')
+    _submit(_run_array_update_op_and_add, 'array_update', 'kArrayUpdate')
+
+    for sweep_model, sweep in sweeps:
+      sweep.result()
+      model.MergeFrom(sweep_model)
 
   # Add free ops.
   for free_op in FREE_OPS:
@@ -1119,21 +1415,35 @@ def run_characterization(
   # Final validation
   delay_model.DelayModel(model)
 
-  print('# proto-file: xls/delay_model/delay_model.proto')
-  print('# proto-message: xls.delay_model.DelayModel')
-  print(model)
+  sys.stdout.write('# proto-file: xls/delay_model/delay_model.proto\n'
+                   '# proto-message: xls.delay_model.DelayModel\n')
+  # Stream the model rather than materializing its (large) text form.
+  text_format.PrintMessage(model, sys.stdout)
 
 
 def main(argv):
   if len(argv) != 1:
     raise app.UsageError('Unexpected arguments.')
 
-  channel_creds = client_credentials.get_credentials()
-  with grpc.secure_channel(f'localhost:{FLAGS.port}', channel_creds) as channel:
-    grpc.channel_ready_future(channel).result()
-    stub = synthesis_service_pb2_grpc.SynthesisServiceStub(channel)
-
-    run_characterization(stub)
+  global _persistent_synthesis_cache
+  if FLAGS.synthesis_cache:
+    _persistent_synthesis_cache = shelve.open(FLAGS.synthesis_cache)
+
+  try:
+    channel_creds = client_credentials.get_credentials()
+    # Verilog is highly repetitive text, so requests compress well.
+    with grpc.secure_channel(
+        f'localhost:{FLAGS.port}',
+        channel_creds,
+        options=_CHANNEL_OPTIONS,
+        compression=grpc.Compression.Gzip) as channel:
+      grpc.channel_ready_future(channel).result()
+      stub = synthesis_service_pb2_grpc.SynthesisServiceStub(channel)
+
+      run_characterization(stub)
+  finally:
+    if _persistent_synthesis_cache is not None:
+      _persistent_synthesis_cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+# Lint as: python3
+# Copyright 2020 The XLS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the synthesis requests of the area characterization client."""
+
+import os
+import re
+import shelve
+import sys
+import threading
+
+from absl.testing import absltest
+from absl.testing import flagsaver
+from xls.common.python import init_xls
+from xls.contrib.integrator.area_model import area_characterization_client_main as client
+from xls.synthesis import synthesis_pb2
+
+
+def setUpModule():
+  # This is required so that module initializers are called including those
+  # which register delay models.
+  init_xls.init_xls(sys.argv)
+
+
+class _FakeFuture:
+  """Already completed stand-in for a grpc.Future."""
+
+  def __init__(self, result):
+    self._result = result
+
+  def add_done_callback(self, fn):
+    fn(self)
+
+  def result(self):
+    return self._result
+
+
+class _FakeBatchCompile:
+  """Stand-in for the BatchCompile method of a synthesis server stub.
+
+  Reports the instance counts of every module defined in each request, except
+  for the modules in 'missing_modules'. The number of cells of each module is
+  the length of its name.
+  """
+
+  def __init__(self, missing_modules=()):
+    self.batch_requests = []
+    self._missing_modules = set(missing_modules)
+
+  def future(self, batch_request):
+    self.batch_requests.append(batch_request)
+    batch_response = synthesis_pb2.BatchCompileResponse()
+    for request in batch_request.requests:
+      response = batch_response.responses.add()
+      response.netlist = '// NETLIST'
+      for module_name in re.findall(r'^module (\w+)\(', request.module_text,
+                                    re.MULTILINE):
+        if module_name not in self._missing_modules:
+          response.module_instance_counts[module_name].cell_histogram[
+              'SB_LUT4'] = len(module_name)
+    return _FakeFuture(batch_response)
+
+
+class _FakeStub:
+  """Stand-in for a synthesis server stub."""
+
+  def __init__(self, missing_modules=()):
+    # pylint: disable=invalid-name
+    self.BatchCompile = _FakeBatchCompile(missing_modules)
+
+
+def _make_request(module_name: str) -> synthesis_pb2.CompileRequest:
+  request = synthesis_pb2.CompileRequest()
+  request.module_text = f'module {module_name}(\n);\nendmodule\n'
+  request.top_module_name = module_name
+  return request
+
+
+def _lut_counts(responses):
+  return [{
+      module_name: instance_count.cell_histogram['SB_LUT4']
+      for module_name, instance_count in response.module_instance_counts.items()
+  } for response in responses]
+
+
+class AreaCharacterizationClientTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    client._synthesis_cache.clear()
+    client._persistent_synthesis_cache = None
+    client._in_flight_requests = threading.BoundedSemaphore(4)
+
+  @flagsaver.flagsaver(batch_size=2)
+  def test_synth_responses_in_request_order(self):
+    stub = _FakeStub()
+    module_names = ['a', 'bb', 'ccc', 'dddd', 'eeeee']
+    responses = client._synth(stub, map(_make_request, module_names))
+
+    self.assertLen(stub.BatchCompile.batch_requests, 3)
+    self.assertEqual(
+        _lut_counts(responses), [{
+            module_name: len(module_name)
+        } for module_name in module_names])
+
+  @flagsaver.flagsaver(batch_size=2)
+  def test_synth_deduplicates_requests(self):
+    stub = _FakeStub()
+    responses = client._synth(
+        stub, map(_make_request, ['a', 'bb', 'a', 'bb', 'a']))
+
+    self.assertLen(stub.BatchCompile.batch_requests, 1)
+    self.assertLen(stub.BatchCompile.batch_requests[0].requests, 2)
+    self.assertEqual(
+        _lut_counts(responses), [{
+            'a': 1
+        }, {
+            'bb': 2
+        }, {
+            'a': 1
+        }, {
+            'bb': 2
+        }, {
+            'a': 1
+        }])
+
+  def test_synth_reuses_cached_responses(self):
+    stub = _FakeStub()
+    first_responses = client._synth(stub, map(_make_request, ['a', 'bb']))
+    self.assertLen(stub.BatchCompile.batch_requests, 2)
+
+    second_responses = client._synth(stub, map(_make_request, ['bb', 'a']))
+    self.assertLen(stub.BatchCompile.batch_requests, 2)
+    self.assertEqual(second_responses, first_responses[::-1])
+
+  def test_synth_distinguishes_request_fields(self):
+    stub = _FakeStub()
+    request = _make_request('a')
+    client._synth(stub, [request])
+    request.preserve_hierarchy = True
+    client._synth(stub, [request])
+
+    self.assertLen(stub.BatchCompile.batch_requests, 2)
+
+  def test_synth_reuses_persistent_responses(self):
+    stub = _FakeStub()
+    cache_path = os.path.join(self.create_tempdir().full_path, 'cache')
+    client._persistent_synthesis_cache = shelve.open(cache_path)
+    try:
+      first_responses = client._synth(stub, [_make_request('a')])
+      client._synthesis_cache.clear()
+      second_responses = client._synth(stub, [_make_request('a')])
+    finally:
+      client._persistent_synthesis_cache.close()
+
+    self.assertLen(stub.BatchCompile.batch_requests, 1)
+    self.assertEqual(second_responses, first_responses)
+    # Only the instance counts are cached.
+    self.assertFalse(second_responses[0].HasField('netlist'))
+    self.assertEqual(_lut_counts(second_responses), [{'a': 1}])
+
+  @flagsaver.flagsaver(ops_per_module=2)
+  def test_synth_sub_modules(self):
+    stub = _FakeStub()
+    sub_modules = [
+        client._prepare_sub_module('add', 'bits[8]', ['bits[8]', 'bits[8]']),
+        client._prepare_sub_module('add', 'bits[16]',
+                                   ['bits[16]', 'bits[16]']),
+        client._prepare_sub_module('add', 'bits[8]', ['bits[8]', 'bits[8]']),
+        client._prepare_sub_module('neg', 'bits[8]', ['bits[8]']),
+    ]
+    instance_counts = client._synth_sub_modules(stub, sub_modules)
+
+    # The three distinct modules are packed into two wrapper modules.
+    self.assertLen(stub.BatchCompile.batch_requests, 2)
+    for batch_request in stub.BatchCompile.batch_requests:
+      for request in batch_request.requests:
+        self.assertTrue(request.preserve_hierarchy)
+    self.assertEqual(
+        [instance_count.cell_histogram['SB_LUT4']
+         for instance_count in instance_counts],
+        [len(module_name) for module_name, _ in sub_modules])
+
+  def test_synth_sub_modules_missing_module(self):
+    sub_modules = [
+        client._prepare_sub_module('add', 'bits[8]', ['bits[8]', 'bits[8]']),
+        client._prepare_sub_module('neg', 'bits[8]', ['bits[8]']),
+    ]
+    stub = _FakeStub(missing_modules=[sub_modules[1][0]])
+    with self.assertRaisesRegex(ValueError, sub_modules[1][0]):
+      client._synth_sub_modules(stub, sub_modules)
+
+
+if __name__ == '__main__':
+  absltest.main()
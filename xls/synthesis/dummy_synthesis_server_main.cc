@@ -58,6 +58,13 @@ class DummySynthesisServiceImpl : public SynthesisService::Service {
                          CompileResponse* result) override {
     auto start = absl::Now();
 
+    // There is no design to report the per-module instance counts of.
+    if (request->preserve_hierarchy()) {
+      return ::grpc::Status(
+          grpc::StatusCode::UNIMPLEMENTED,
+          "preserve_hierarchy is not supported by the dummy synthesis server");
+    }
+
     result->set_slack_ps(request->target_frequency_hz() <= max_frequency_hz_
                              ? 0
                              : 1e12L / request->target_frequency_hz() -
@@ -74,6 +81,23 @@ class DummySynthesisServiceImpl : public SynthesisService::Service {
     return ::grpc::Status::OK;
   }
 
+  ::grpc::Status BatchCompile(::grpc::ServerContext* server_context,
+                              const BatchCompileRequest* request,
+                              BatchCompileResponse* result) override {
+    for (const CompileRequest& compile_request : request->requests()) {
+      CompileResponse* response = result->add_responses();
+      ::grpc::Status status =
+          Compile(server_context, &compile_request, response);
+      if (!status.ok()) {
+        return status;
+      }
+      if (request->omit_netlists()) {
+        response->clear_netlist();
+      }
+    }
+    return ::grpc::Status::OK;
+  }
+
  private:
   int64 max_frequency_hz_;
   bool serve_errors_;
@@ -17,12 +17,15 @@
 
 import subprocess
 
+import grpc
 import portpicker
 
 from google.protobuf import text_format
 from absl.testing import absltest
 from xls.common import runfiles
+from xls.synthesis import client_credentials
 from xls.synthesis import synthesis_pb2
+from xls.synthesis import synthesis_service_pb2_grpc
 
 CLIENT_PATH = runfiles.get_path('xls/synthesis/synthesis_client_main')
 SERVER_PATH = runfiles.get_path('xls/synthesis/dummy_synthesis_server_main')
@@ -46,6 +49,22 @@ class SynthesisServerTest(absltest.TestCase):
                             args)
     return port, proc
 
+  def _batch_compile(
+      self, port: int, batch_request: synthesis_pb2.BatchCompileRequest
+  ) -> synthesis_pb2.BatchCompileResponse:
+    channel_creds = client_credentials.get_credentials()
+    with grpc.secure_channel(f'localhost:{port}', channel_creds) as channel:
+      grpc.channel_ready_future(channel).result()
+      stub = synthesis_service_pb2_grpc.SynthesisServiceStub(channel)
+      return stub.BatchCompile(batch_request)
+
+  def _add_request(self, batch_request: synthesis_pb2.BatchCompileRequest,
+                   target_frequency_hz: int):
+    request = batch_request.requests.add()
+    request.module_text = VERILOG
+    request.top_module_name = 'main'
+    request.target_frequency_hz = target_frequency_hz
+
   def test_slack(self):
     port, proc = self._start_server(['--max_frequency_ghz=2.0'])
 
@@ -82,6 +101,71 @@ class SynthesisServerTest(absltest.TestCase):
     proc.terminate()
     proc.wait()
 
+  def test_batch_compile(self):
+    port, proc = self._start_server(['--max_frequency_ghz=2.0'])
+
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    self._add_request(batch_request, int(4e9))
+    self._add_request(batch_request, int(1e9))
+    self._add_request(batch_request, int(3e9))
+    response = self._batch_compile(port, batch_request)
+
+    # Responses are in the same order as the requests.
+    self.assertLen(response.responses, 3)
+    self.assertLess(response.responses[0].slack_ps, 0)
+    self.assertGreaterEqual(response.responses[1].slack_ps, 0)
+    self.assertLess(response.responses[2].slack_ps, 0)
+    self.assertLess(response.responses[0].slack_ps,
+                    response.responses[2].slack_ps)
+    for compile_response in response.responses:
+      self.assertEqual(compile_response.netlist, '// NETLIST')
+
+    proc.terminate()
+    proc.wait()
+
+  def test_batch_compile_omit_netlists(self):
+    port, proc = self._start_server(['--max_frequency_ghz=2.0'])
+
+    batch_request = synthesis_pb2.BatchCompileRequest(omit_netlists=True)
+    self._add_request(batch_request, int(1e9))
+    self._add_request(batch_request, int(1e9))
+    response = self._batch_compile(port, batch_request)
+
+    self.assertLen(response.responses, 2)
+    for compile_response in response.responses:
+      self.assertFalse(compile_response.HasField('netlist'))
+      self.assertEqual(compile_response.area, 123)
+
+    proc.terminate()
+    proc.wait()
+
+  def test_batch_compile_error(self):
+    port, proc = self._start_server(
+        ['--max_frequency_ghz=2.0', '--serve_errors'])
+
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    self._add_request(batch_request, int(1e9))
+    self._add_request(batch_request, int(1e9))
+    with self.assertRaises(grpc.RpcError) as context:
+      self._batch_compile(port, batch_request)
+    self.assertEqual(context.exception.code(), grpc.StatusCode.INTERNAL)
+
+    proc.terminate()
+    proc.wait()
+
+  def test_preserve_hierarchy_unsupported(self):
+    port, proc = self._start_server(['--max_frequency_ghz=2.0'])
+
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    self._add_request(batch_request, int(1e9))
+    batch_request.requests[0].preserve_hierarchy = True
+    with self.assertRaises(grpc.RpcError) as context:
+      self._batch_compile(port, batch_request)
+    self.assertEqual(context.exception.code(), grpc.StatusCode.UNIMPLEMENTED)
+
+    proc.terminate()
+    proc.wait()
+
 
 if __name__ == '__main__':
   absltest.main()
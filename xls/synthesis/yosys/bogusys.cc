@@ -12,6 +12,7 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "absl/algorithm/container.h"
 #include "absl/status/status.h"
 #include "absl/status/statusor.h"
 #include "absl/strings/str_join.h"
@@ -26,7 +27,8 @@
 
 const char kUsage[] =
     "A bogus yosys binary used by tests. It regurgitates a precanned stdout "
-    "which looks like yosys output and writes a json netlist file output.";
+    "which looks like yosys output and writes a json netlist file output. If "
+    "-noflatten is given, the stdout includes the statistics of each module.";
 
 // Canned snippet of yosys output.
 const char kYosysOutput[] = R"(
@@ -78,6 +80,13 @@ absl::StatusOr<std::string> GetJsonOutputPath(
       "'-json FILE' substring not found in arguments.");
 }
 
+// Returns whether the "-noflatten" option is in the arguments.
+bool HasNoflattenOption(absl::Span<const std::string> args) {
+  std::string joined_args = absl::StrJoin(args, " ");
+  std::vector<std::string> split_args = absl::StrSplit(joined_args, ' ');
+  return absl::c_linear_search(split_args, "-noflatten");
+}
+
 absl::Status RealMain(absl::Span<const std::string> args) {
   XLS_ASSIGN_OR_RETURN(std::string json_out_path, GetJsonOutputPath(args));
   XLS_ASSIGN_OR_RETURN(
@@ -85,7 +94,15 @@ absl::Status RealMain(absl::Span<const std::string> args) {
       GetXlsRunfilePath("xls/synthesis/yosys/testdata/netlist.json"));
   XLS_ASSIGN_OR_RETURN(std::string json, GetFileContents(runfile_path));
   XLS_RETURN_IF_ERROR(SetFileContents(json_out_path, json));
-  std::cout << kYosysOutput;
+  if (HasNoflattenOption(args)) {
+    XLS_ASSIGN_OR_RETURN(
+        std::string output_path,
+        GetXlsRunfilePath("xls/synthesis/yosys/testdata/yosys_noflatten.out"));
+    XLS_ASSIGN_OR_RETURN(std::string output, GetFileContents(output_path));
+    std::cout << output;
+  } else {
+    std::cout << kYosysOutput;
+  }
   return absl::OkStatus();
 }
 
@@ -86,6 +86,23 @@ class YosysSynthesisServiceImpl : public SynthesisService::Service {
     return ::grpc::Status::OK;
   }
 
+  ::grpc::Status BatchCompile(::grpc::ServerContext* server_context,
+                              const BatchCompileRequest* request,
+                              BatchCompileResponse* result) override {
+    for (const CompileRequest& compile_request : request->requests()) {
+      CompileResponse* response = result->add_responses();
+      ::grpc::Status status =
+          Compile(server_context, &compile_request, response);
+      if (!status.ok()) {
+        return status;
+      }
+      if (request->omit_netlists()) {
+        response->clear_netlist();
+      }
+    }
+    return ::grpc::Status::OK;
+  }
+
   // Run the given arguments as a subprocess with InvokeSubprocess.
   // InvokeSubprocess is wrapped because the error message can be very large (it
   // includes both stdout and stderr) which breaks propagation of the error via
@@ -136,6 +153,9 @@ class YosysSynthesisServiceImpl : public SynthesisService::Service {
     std::string yosys_cmd =
         absl::StrFormat("synth_%s -top %s -json %s", synthesis_target_,
                         request->top_module_name(), netlist_path.string());
+    if (request->preserve_hierarchy()) {
+      absl::StrAppend(&yosys_cmd, " -noflatten");
+    }
     XLS_LOG(INFO) << "yosys cmd: " << yosys_cmd;
     XLS_ASSIGN_OR_RETURN(
         string_pair,
@@ -160,6 +180,17 @@ class YosysSynthesisServiceImpl : public SynthesisService::Service {
       (*result->mutable_instance_count()
             ->mutable_cell_histogram())[name_count.first] = name_count.second;
     }
+    if (request->preserve_hierarchy()) {
+      for (const auto& [module_name, cell_histogram] :
+           parse_stats.module_cell_histograms) {
+        InstanceCount& instance_count =
+            (*result->mutable_module_instance_counts())[module_name];
+        for (const auto& name_count : cell_histogram) {
+          (*instance_count.mutable_cell_histogram())[name_count.first] =
+              name_count.second;
+        }
+      }
+    }
 
     // If only synthesis requested, done.
     if (absl::GetFlag(FLAGS_synthesis_only)) {
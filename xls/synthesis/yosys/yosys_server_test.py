@@ -17,12 +17,15 @@
 
 import subprocess
 
+import grpc
 import portpicker
 
 from google.protobuf import text_format
 from absl.testing import absltest
 from xls.common import runfiles
+from xls.synthesis import client_credentials
 from xls.synthesis import synthesis_pb2
+from xls.synthesis import synthesis_service_pb2_grpc
 
 CLIENT_PATH = runfiles.get_path('xls/synthesis/synthesis_client_main')
 SERVER_PATH = runfiles.get_path('xls/synthesis/yosys/yosys_server_main')
@@ -53,6 +56,15 @@ class SynthesisServerTest(absltest.TestCase):
     ])
     return port, proc
 
+  def _batch_compile(
+      self, port: int, batch_request: synthesis_pb2.BatchCompileRequest
+  ) -> synthesis_pb2.BatchCompileResponse:
+    channel_creds = client_credentials.get_credentials()
+    with grpc.secure_channel(f'localhost:{port}', channel_creds) as channel:
+      grpc.channel_ready_future(channel).result()
+      stub = synthesis_service_pb2_grpc.SynthesisServiceStub(channel)
+      return stub.BatchCompile(batch_request)
+
   def test_slack(self):
     port, proc = self._start_server()
 
@@ -90,6 +102,106 @@ class SynthesisServerTest(absltest.TestCase):
     proc.terminate()
     proc.wait()
 
+  def test_batch_compile(self):
+    port, proc = self._start_server()
+
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    for _ in range(3):
+      request = batch_request.requests.add()
+      request.module_text = VERILOG
+      request.top_module_name = 'main'
+      request.target_frequency_hz = int(1e9)
+    response = self._batch_compile(port, batch_request)
+
+    # The responses are generated by parsing bogusys stdout and
+    # testdata/nextpnr.out.
+    self.assertLen(response.responses, 3)
+    for compile_response in response.responses:
+      self.assertEqual(compile_response.max_frequency_hz, 180280000)
+      self.assertEqual(compile_response.instance_count.cell_histogram['CCU2C'],
+                       32)
+      self.assertNotEmpty(compile_response.netlist)
+
+    proc.terminate()
+    proc.wait()
+
+  def test_batch_compile_omit_netlists(self):
+    port, proc = self._start_server()
+
+    batch_request = synthesis_pb2.BatchCompileRequest(omit_netlists=True)
+    request = batch_request.requests.add()
+    request.module_text = VERILOG
+    request.top_module_name = 'main'
+    response = self._batch_compile(port, batch_request)
+
+    self.assertLen(response.responses, 1)
+    self.assertFalse(response.responses[0].HasField('netlist'))
+    self.assertEqual(response.responses[0].max_frequency_hz, 180280000)
+
+    proc.terminate()
+    proc.wait()
+
+  def test_batch_compile_error(self):
+    port, proc = self._start_server()
+
+    # The second request is invalid because it has no top module name.
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    request = batch_request.requests.add()
+    request.module_text = VERILOG
+    request.top_module_name = 'main'
+    request = batch_request.requests.add()
+    request.module_text = VERILOG
+    with self.assertRaises(grpc.RpcError) as context:
+      self._batch_compile(port, batch_request)
+    self.assertEqual(context.exception.code(), grpc.StatusCode.INTERNAL)
+    self.assertIn('top module name', context.exception.details())
+
+    proc.terminate()
+    proc.wait()
+
+  def test_module_instance_counts(self):
+    port, proc = self._start_server()
+
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    request = batch_request.requests.add()
+    request.module_text = VERILOG
+    request.top_module_name = 'main'
+    request.preserve_hierarchy = True
+    response = self._batch_compile(port, batch_request).responses[0]
+
+    # The response is generated by parsing testdata/yosys_noflatten.out.
+    self.assertEqual(
+        dict(response.instance_count.cell_histogram), {
+            'CCU2C': 32,
+            'TRELLIS_FF': 192
+        })
+    self.assertLen(response.module_instance_counts, 2)
+    self.assertEqual(
+        dict(response.module_instance_counts['adder'].cell_histogram),
+        {'CCU2C': 16})
+    self.assertEqual(
+        dict(response.module_instance_counts['main'].cell_histogram), {
+            'TRELLIS_FF': 192,
+            'adder': 2
+        })
+
+    proc.terminate()
+    proc.wait()
+
+  def test_no_module_instance_counts_without_preserve_hierarchy(self):
+    port, proc = self._start_server()
+
+    batch_request = synthesis_pb2.BatchCompileRequest()
+    request = batch_request.requests.add()
+    request.module_text = VERILOG
+    request.top_module_name = 'main'
+    response = self._batch_compile(port, batch_request).responses[0]
+
+    self.assertEmpty(response.module_instance_counts)
+
+    proc.terminate()
+    proc.wait()
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -14,6 +14,8 @@
 
 #include "xls/synthesis/yosys/yosys_util.h"
 
+#include <iterator>
+
 #include "absl/strings/match.h"
 #include "absl/strings/numbers.h"
 #include "absl/strings/str_split.h"
@@ -108,6 +110,36 @@ absl::StatusOr<YosysSynthesisStatistics> ParseYosysOutput(
     }
   }
 
+  // Process per-module cell histograms. Yosys prints the statistics of each
+  // module under a "=== <module name> ===" header. For hierarchical designs
+  // a final "=== design hierarchy ===" section describes the whole design.
+  std::string module_name;
+  for (parse_line_itr = lines.begin(); parse_line_itr != lines.end();
+       ++parse_line_itr) {
+    std::string header_name;
+    if (RE2::FullMatch(*parse_line_itr, "=== (.+) ===", &header_name)) {
+      module_name = header_name;
+      continue;
+    }
+    if (module_name.empty() || module_name == "design hierarchy" ||
+        !absl::StrContains(*parse_line_itr, "Number of cells:")) {
+      continue;
+    }
+    // Statistics may be printed more than once; the last printing wins.
+    absl::flat_hash_map<std::string, int64>& histogram =
+        stats.module_cell_histograms[module_name];
+    histogram.clear();
+    int64 cell_count;
+    std::string cell_name;
+    while (std::next(parse_line_itr) != lines.end() &&
+           RE2::FullMatch(*std::next(parse_line_itr),
+                          "\\s+(\\w+)\\s+(\\d+)\\s*", &cell_name,
+                          &cell_count)) {
+      histogram[cell_name] = cell_count;
+      ++parse_line_itr;
+    }
+  }
+
   return stats;
 }
 
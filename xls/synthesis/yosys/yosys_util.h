@@ -33,6 +33,10 @@ absl::StatusOr<int64> ParseNextpnrOutput(absl::string_view nextpnr_output);
 struct YosysSynthesisStatistics {
   // Could add other fields for things like wires / memory...
   absl::flat_hash_map<std::string, int64> cell_histogram;
+  // Cell histogram of each module in the design, keyed by module name. Only
+  // meaningful if the design was not flattened.
+  absl::flat_hash_map<std::string, absl::flat_hash_map<std::string, int64>>
+      module_cell_histograms;
 };
 absl::StatusOr<YosysSynthesisStatistics> ParseYosysOutput(
     absl::string_view yosys_output);
@@ -94,6 +94,92 @@ found and reported 0 problems.
                                    std::pair(std::string("TRELLIS_FF"), 192)));
 }
 
+TEST(YosysUtilTest, ParseYosysOutputPerModule) {
+  std::string input = R"(
+2.1.1. Analyzing design hierarchy..
+Top module:  \wrapper
+Used module:     \add_8
+Used module:     \add_16
+
+2.49. Printing statistics.
+
+=== add_16 ===
+
+   Number of wires:                  3
+   Number of wire bits:             48
+   Number of public wires:           3
+   Number of public wire bits:      48
+   Number of memories:               0
+   Number of memory bits:            0
+   Number of processes:              0
+   Number of cells:                 30
+     SB_CARRY                       14
+     SB_LUT4                        16
+
+=== add_8 ===
+
+   Number of wires:                  3
+   Number of wire bits:             24
+   Number of public wires:           3
+   Number of public wire bits:      24
+   Number of memories:               0
+   Number of memory bits:            0
+   Number of processes:              0
+   Number of cells:                 14
+     SB_CARRY                        6
+     SB_LUT4                         8
+
+=== wrapper ===
+
+   Number of wires:                  6
+   Number of wire bits:             72
+   Number of public wires:           6
+   Number of public wire bits:      72
+   Number of memories:               0
+   Number of memory bits:            0
+   Number of processes:              0
+   Number of cells:                  2
+     add_16                          1
+     add_8                           1
+
+=== design hierarchy ===
+
+   wrapper                           1
+     add_16                          1
+     add_8                           1
+
+   Number of wires:                 12
+   Number of wire bits:            144
+   Number of public wires:          12
+   Number of public wire bits:     144
+   Number of memories:               0
+   Number of memory bits:            0
+   Number of processes:              0
+   Number of cells:                 44
+     SB_CARRY                       20
+     SB_LUT4                        24
+
+2.50. Executing CHECK pass (checking for obvious problems).
+checking module wrapper..
+found and reported 0 problems.
+  )";
+  XLS_ASSERT_OK_AND_ASSIGN(YosysSynthesisStatistics stats,
+                           ParseYosysOutput(input));
+  EXPECT_THAT(stats.cell_histogram,
+              UnorderedElementsAre(std::pair(std::string("SB_CARRY"), 20),
+                                   std::pair(std::string("SB_LUT4"), 24)));
+  EXPECT_EQ(stats.module_cell_histograms.size(), 3);
+  EXPECT_THAT(stats.module_cell_histograms.at("add_8"),
+              UnorderedElementsAre(std::pair(std::string("SB_CARRY"), 6),
+                                   std::pair(std::string("SB_LUT4"), 8)));
+  EXPECT_THAT(stats.module_cell_histograms.at("add_16"),
+              UnorderedElementsAre(std::pair(std::string("SB_CARRY"), 14),
+                                   std::pair(std::string("SB_LUT4"), 16)));
+  EXPECT_THAT(stats.module_cell_histograms.at("wrapper"),
+              UnorderedElementsAre(std::pair(std::string("add_16"), 1),
+                                   std::pair(std::string("add_8"), 1)));
+}
+
 TEST(YosysUtilTest, ParseYosysOutputTopModuleMissing) {
   std::string input = R"(
 2.1.1. Analyzing design hierarchy..